@@ -203,7 +203,7 @@ class SqliteBackend(DatabaseBackend):
         old = list(self.table_select(table_name, uri_query, data=data))
         sql = self.generator_class(f'"{self.schema}{self.sep}{table_name}"', uri_query, data=data)
         with sqlite_session(self.engine) as session:
-            session.execute(sql.update_query)
+            session.execute(sql.update_query, sql.update_params)
         audit_data = []
         for val in old:
             audit_data.append({
@@ -359,7 +359,7 @@ class PostgresBackend(object):
         old = list(self.table_select(table_name, uri_query, data=data))
         sql = self.generator_class(f'{self.schema}{self.sep}"{table_name}"', uri_query, data=data)
         with postgres_session(self.pool) as session:
-            session.execute(sql.update_query)
+            session.execute(sql.update_query, sql.update_params)
         audit_data = []
         for val in old:
             audit_data.append({
@@ -1,5 +1,8 @@
 
+import functools
 import json
+import re
+import types
 
 from typing import Union, Callable, Optional
 
@@ -16,10 +19,77 @@ from pysquril.parser import (
     OrderTerm,
     RangeTerm,
     SetTerm,
-    Clause,
     UriQuery,
 )
 
+_OPERATORS = types.MappingProxyType({
+    'eq': '=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'neq': '!=',
+    'like': 'like',
+    'ilike': 'ilike',
+    'not': 'not',
+    'is': 'is',
+    'in': 'in'
+})
+
+# isinstance targets
+_ARRAY_SPECIFIC_SUB = (ArraySpecificSingle, ArraySpecificMultiple)
+_ELEMENT_TERMS = (WhereTerm, OrderTerm) # terms with a select_term in their element
+
+_MISSING_JSON_ARRAY_SQL = 'Extending the SqlGenerator requires setting the class level property: json_array_sql'
+
+_BRACKET_TABLE = str.maketrans({'[': '', ']': ''})
+_LIKE_TABLE = str.maketrans({'*': '%'})
+
+
+def _minify(sql: str) -> str:
+    # collapse whitespace outside of string literals
+    parts = sql.split("'")
+    parts[::2] = [re.sub(r'\s+', ' ', part) for part in parts[::2]]
+    return "'".join(parts).strip()
+
+
+def _is_int_literal(val: str) -> bool:
+    # an optional sign, followed by decimal digits, ignoring
+    # surrounding whitespace - checked without raising and
+    # catching ValueError for all non-numeric values
+    val = val.strip()
+    if val[:1] in ('-', '+'):
+        val = val[1:]
+    return val.isdecimal()
+
+
+@functools.lru_cache(maxsize=2048)
+def _parse_uri(table_name: str, uri_query: str) -> UriQuery:
+    # generators do not modify parsed queries, so they can be shared
+    return UriQuery(table_name, uri_query)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(cls: type, table_name: str, uri_query: str) -> tuple:
+    """
+    Parse a URI query, and generate the SQL which does not
+    depend on the data passed to the constructor.
+
+    Applications commonly repeat identical URI queries,
+    so the result is cached. Since the inputs are immutable
+    strings, the cache never needs to be invalidated.
+
+    """
+    generator = cls.__new__(cls)
+    generator._setup(table_name, uri_query, None, _parse_uri(table_name, uri_query))
+    return (
+        generator.parsed_uri_query,
+        generator.sql_select(),
+        generator.sql_delete(),
+        generator._gen_sql_where_clause(),
+    )
+
+
 class SqlGenerator(object):
 
     """
@@ -29,36 +99,65 @@ class SqlGenerator(object):
 
     db_init_sql = None
     json_array_sql = None
+    operators = _OPERATORS
 
     def __init__(
         self,
         table_name: str,
         uri_query: str,
         data: Union[list, dict] = None,
+    ) -> None:
+        if not self.json_array_sql: # only possible for SqlGenerator itself
+            raise TypeError(_MISSING_JSON_ARRAY_SQL)
+        parsed_uri_query, select_query, delete_query, where_clause = _compile(
+            self.__class__, table_name, uri_query
+        )
+        self._setup(table_name, uri_query, data, parsed_uri_query)
+        self._where_clause = where_clause
+        self.select_query = select_query
+        self.delete_query = delete_query
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if not cls.json_array_sql:
+            raise TypeError(_MISSING_JSON_ARRAY_SQL)
+        # select handlers, resolved once per class, keyed on element type
+        cls._select_dispatch = {
+            Key: cls._gen_sql_key_selection,
+            ArraySpecific: cls._gen_sql_array_selection,
+            ArraySpecificSingle: cls._gen_sql_array_sub_selection,
+            ArraySpecificMultiple: cls._gen_sql_array_sub_selection,
+            ArrayBroadcastSingle: cls._gen_sql_array_sub_selection,
+            ArrayBroadcastMultiple: cls._gen_sql_array_sub_selection,
+        }
+
+    def _setup(
+        self,
+        table_name: str,
+        uri_query: str,
+        data: Union[list, dict],
+        parsed_uri_query: UriQuery,
     ) -> None:
         self.table_name = table_name
         self.uri_query = uri_query
         self.data = data
-        self.parsed_uri_query = UriQuery(table_name, uri_query)
-        self.operators = {
-            'eq': '=',
-            'gt': '>',
-            'gte': '>=',
-            'lt': '<',
-            'lte': '<=',
-            'neq': '!=',
-            'like': 'like',
-            'ilike': 'ilike',
-            'not': 'not',
-            'is': 'is',
-            'in': 'in'
-        }
-        if not self.json_array_sql:
-            msg = 'Extending the SqlGenerator requires setting the class level property: json_array_sql'
-            raise Exception(msg)
-        self.select_query = self.sql_select()
-        self.update_query = self.sql_update()
-        self.delete_query = self.sql_delete()
+        self.parsed_uri_query = parsed_uri_query
+        self._where_clause = None
+        self._update = None
+
+    @property
+    def update_query(self) -> str:
+        return self._get_update()[0]
+
+    @property
+    def update_params(self) -> tuple:
+        return self._get_update()[1]
+
+    def _get_update(self) -> tuple:
+        # depends on the data, so only generated when used
+        if self._update is None:
+            self._update = self.sql_update()
+        return self._update
 
     # Classes that extend the SqlGenerator must implement the following methods
     # they are called by functions that are mapped over terms in clauses
@@ -112,43 +211,36 @@ class SqlGenerator(object):
         """
         raise NotImplementedError
 
-    def _gen_sql_update(self, term: Key) -> list:
+    def _gen_sql_update(self, term: Key) -> tuple:
         """
-        Generate a list of update expressions, from a term
-        using the data passed to the constructor.
+        Generate an update expression, from a term, along with
+        a tuple of query parameters, holding the data passed
+        to the constructor.
 
         """
         raise NotImplementedError
 
-    def _clause_map_terms(self, clause: Clause, map_func: Callable) -> list:
-        # apply a function to all Terms in a clause
-        out = []
-        for term in clause.parsed:
-            res = map_func(term)
-            out.append(res)
-        return out
+    def _map(self, clause_name: str, map_func: Callable) -> Optional[list]:
+        # apply a function to all Terms in a clause, if present
+        clause = getattr(self.parsed_uri_query, clause_name)
+        return [map_func(term) for term in clause.parsed] if clause else None
 
     # methods for mapping functions over terms in different types of clauses
 
     def select_map(self, map_func: Callable) -> Optional[list]:
-        return self._clause_map_terms(self.parsed_uri_query.select, map_func) \
-            if self.parsed_uri_query.select else None
+        return self._map('select', map_func)
 
     def where_map(self, map_func: Callable) -> Optional[list]:
-        return self._clause_map_terms(self.parsed_uri_query.where, map_func) \
-            if self.parsed_uri_query.where else None
+        return self._map('where', map_func)
 
     def order_map(self, map_func: Callable) -> Optional[list]:
-        return self._clause_map_terms(self.parsed_uri_query.order, map_func) \
-            if self.parsed_uri_query.order else None
+        return self._map('order', map_func)
 
     def range_map(self, map_func: Callable) -> Optional[list]:
-        return self._clause_map_terms(self.parsed_uri_query.range, map_func) \
-            if self.parsed_uri_query.range else None
+        return self._map('range', map_func)
 
     def set_map(self, map_func: Callable) -> Optional[list]:
-        return self._clause_map_terms(self.parsed_uri_query.set, map_func) \
-            if self.parsed_uri_query.set else None
+        return self._map('set', map_func)
 
     # term handler functions
     # mapped over terms in a clause
@@ -157,27 +249,15 @@ class SqlGenerator(object):
     # which are implemented for specific SQL backend implementations
 
     def _term_to_sql_select(self, term: SelectTerm) -> str:
-        rev = term.parsed.copy()
-        rev.reverse()
-        out = []
-        first_done = False
-        for parsed in rev:
-            if isinstance(parsed, Key):
-                if not first_done:
-                    selection = self._gen_sql_key_selection(term, parsed)
-            elif isinstance(parsed, ArraySpecific):
-                selection = self._gen_sql_array_selection(term, parsed)
-            elif (
-                isinstance(parsed, ArraySpecificSingle)
-                or isinstance(parsed, ArraySpecificMultiple)
-                or isinstance(parsed, ArrayBroadcastSingle)
-                or isinstance(parsed, ArrayBroadcastMultiple)
-            ):
-                selection = self._gen_sql_array_sub_selection(term, parsed)
-            else:
-                raise Exception(f'Could not parse {term.original}')
-            first_done = True
-        return selection
+        # the outermost array element determines the selection,
+        # and if there are none, the innermost key does
+        for parsed in term.parsed:
+            if type(parsed) is not Key:
+                break
+        handler = self._select_dispatch.get(type(parsed))
+        if not handler:
+            raise Exception(f'Could not parse {term.original}')
+        return handler(self, term, parsed)
 
     def _term_to_sql_where(self, term: WhereTerm) -> str:
         groups_start = ''.join(term.parsed[0].groups_start)
@@ -186,32 +266,21 @@ class SqlGenerator(object):
         col = self._gen_sql_col(term)
         op = term.parsed[0].op
         val = term.parsed[0].val
-        try:
-            int(val)
+        if isinstance(val, float) or _is_int_literal(val):
             val = f"'{val}'" if op in ['eq', 'neq'] else val
-        except ValueError:
-            if val == 'null' or op == 'in':
-                val = f'{val}'
-            else:
-                val = f"'{val}'"
+        elif val != 'null' and op != 'in':
+            val = f"'{val}'"
         if op.endswith('.not'):
             op = op.replace('.', ' ')
         elif op.startswith('not.'):
             op = op.replace('.', ' ')
         elif op == 'in':
-            val = val.replace('[', '')
-            val = val.replace(']', '')
-            values = val.split(',')
-            new_values = []
-            for v in values:
-                new = "'%s'" % v
-                new_values.append(new)
-            joined = ','.join(new_values)
-            val = "(%s)" % joined
+            values = val.translate(_BRACKET_TABLE).split(',')
+            val = "('" + "','".join(values) + "')"
         else:
             op = self.operators[op]
-        if 'like' in op or 'ilike' in op:
-            val = val.replace('*', '%')
+        if op.endswith('like'):
+            val = val.translate(_LIKE_TABLE)
         out = f'{groups_start} {combinator} {col} {op} {val} {groups_end}'
         return out
 
@@ -223,53 +292,59 @@ class SqlGenerator(object):
     def _term_to_sql_range(self, term: RangeTerm) -> str:
         return f'limit {term.parsed[0].end} offset {term.parsed[0].start}'
 
-    def _term_to_sql_update(self, term: SelectTerm) -> list:
+    def _term_to_sql_update(self, term: SelectTerm) -> tuple:
         return self._gen_sql_update(term)
 
     # mapper methods - used by public methods
 
     def _gen_sql_select_clause(self) -> str:
-        out = self.select_map(self._term_to_sql_select)
-        if not out:
-            sql_select = f'select * from {self.table_name}'
-        else:
-            joined = ",".join(out)
-            sql_select = f"select {self.json_array_sql}({joined}) from {self.table_name}"
-        return sql_select
+        if not self.parsed_uri_query.select:
+            return f'select * from {self.table_name}'
+        joined = ",".join(self._map('select', self._term_to_sql_select))
+        return f"select {self.json_array_sql}({joined}) from {self.table_name}"
 
     def _gen_sql_where_clause(self) -> str:
-        out = self.where_map(self._term_to_sql_where)
-        if not out:
+        # shared by select, update, and delete, so only generated once
+        if self._where_clause is not None:
+            return self._where_clause
+        if not self.parsed_uri_query.where:
             sql_where = ''
         else:
-            joined = ' '.join(out)
+            joined = ' '.join(self._map('where', self._term_to_sql_where))
             sql_where = f'where {joined}'
+        self._where_clause = sql_where
         return sql_where
 
     def _gen_sql_order_clause(self) -> str:
-        out = self.order_map(self._term_to_sql_order)
-        if not out:
+        if not self.parsed_uri_query.order:
             return ''
-        else:
-            return out[0]
+        return self._map('order', self._term_to_sql_order)[0]
 
     def _gen_sql_range_clause(self) -> str:
-        out = self.range_map(self._term_to_sql_range)
-        if not out:
+        if not self.parsed_uri_query.range:
             return ''
-        else:
-            return out[0]
+        return self._map('range', self._term_to_sql_range)[0]
 
-    # public methods - called by constructor
+    # public methods - used to generate the queries
 
     def sql_select(self) -> str:
-        _select = self._gen_sql_select_clause()
-        _where = self._gen_sql_where_clause()
-        _order = self._gen_sql_order_clause()
-        _range = self._gen_sql_range_clause()
-        return f'{_select} {_where} {_order} {_range}'
+        parts = [
+            self._gen_sql_select_clause(),
+            self._gen_sql_where_clause(),
+            self._gen_sql_order_clause(),
+            self._gen_sql_range_clause(),
+        ]
+        return ' '.join(part for part in parts if part)
+
+    def _escape_sql(self, sql: str) -> str:
+        """
+        Escape SQL which is executed along with query parameters,
+        if the driver requires it.
+
+        """
+        return sql
 
-    def sql_update(self) -> str:
+    def sql_update(self) -> tuple:
         """
         Implementation notes:
 
@@ -302,16 +377,24 @@ class SqlGenerator(object):
         or more update statements, depending on how many JSON keys
         are being changed. For sqlite it is always only one statement.
 
+        The new data is not embedded in the statements, but passed
+        as query parameters, so the return value is a tuple of
+        the statements, and the parameters for all of them.
+
         """
-        out = self.set_map(self._term_to_sql_update)
+        out = self._map('set', self._term_to_sql_update)
         if not out:
-            return ''
+            return '', ()
         else:
-            _where = self._gen_sql_where_clause()
-            _query = ""
-            for expr in set(out):
-                _query += f"update {self.table_name} {expr} {_where}; "
-            return _query
+            _table = self._escape_sql(self.table_name)
+            _where = self._escape_sql(self._gen_sql_where_clause())
+            statements = []
+            params = []
+            for expr, expr_params in set(out):
+                parts = [f'update {_table}', expr, _where]
+                statements.append(' '.join(part for part in parts if part) + ';')
+                params.extend(expr_params)
+            return ' '.join(statements), tuple(params)
 
     def sql_delete(self) -> str:
         _where = self._gen_sql_where_clause()
@@ -328,19 +411,35 @@ class SqliteQueryGenerator(SqlGenerator):
 
     db_init_sql = None
     json_array_sql = 'json_array'
+    array_sub_selection_sql = _minify("""
+                (case when json_extract(data, '$.{bare_term}') is not null then (
+                    select {vals} from (
+                        select
+                            {sub_selections} as vals
+                        from (
+                            select key, value, fullkey, path
+                            from {table_name}, json_tree({table_name}.data)
+                            where path = '$.{bare_term}'
+                            {fullkey}
+                            )
+                        )
+                    )
+                else null end)
+            """)
 
     # Helper functions - used by mappers
 
     def _maybe_apply_function(self, term: SelectTerm, selection: str) -> str:
-        if not term.func:
+        func = term.func
+        if not func:
             return selection
-        elif term.func == 'count':
+        elif func == 'count':
             if term.original in ['*', '1']:
                 selection = '1'
         else:
-            if term.func.endswith('_ts'):
-                term.func = term.func.replace('_ts', '')
-        return f"{term.func}({selection})"
+            if func.endswith('_ts'):
+                func = func.replace('_ts', '')
+        return f"{func}({selection})"
 
     def _gen_sql_key_selection(self, term: SelectTerm, parsed: Key) -> str:
         return self._maybe_apply_function(term, f"json_extract(data, '$.{term.original}')")
@@ -358,10 +457,7 @@ class SqliteQueryGenerator(SqlGenerator):
             ArrayBroadcastMultiple,
         ],
     ) -> str:
-        if (
-            isinstance(parsed, ArraySpecificSingle)
-            or isinstance(parsed, ArraySpecificMultiple)
-        ):
+        if isinstance(parsed, _ARRAY_SPECIFIC_SUB):
             fullkey = f"and fullkey = '$.{term.bare_term}[{parsed.idx}]'"
             vals = 'vals'
         else:
@@ -372,25 +468,17 @@ class SqliteQueryGenerator(SqlGenerator):
             temp.append(f"json_extract(value, '$.{key}')")
         sub_selections = ','.join(temp)
         sub_selections = f'json_array({sub_selections})' if len(temp) > 1 else f'{sub_selections}'
-        selection = f"""
-                (case when json_extract(data, '$.{term.bare_term}') is not null then (
-                    select {vals} from (
-                        select
-                            {sub_selections} as vals
-                        from (
-                            select key, value, fullkey, path
-                            from {self.table_name}, json_tree({self.table_name}.data)
-                            where path = '$.{term.bare_term}'
-                            {fullkey}
-                            )
-                        )
-                    )
-                else null end)
-            """
+        selection = self.array_sub_selection_sql.format(
+            bare_term=term.bare_term,
+            vals=vals,
+            sub_selections=sub_selections,
+            table_name=self.table_name,
+            fullkey=fullkey,
+        )
         return self._maybe_apply_function(term, selection)
 
     def _gen_sql_col(self, term: Union[SelectTerm, WhereTerm, OrderTerm]) -> str:
-        if isinstance(term, WhereTerm) or isinstance(term, OrderTerm):
+        if isinstance(term, _ELEMENT_TERMS):
             select_term = term.parsed[0].select_term
         elif isinstance(term, SelectTerm):
             select_term = term
@@ -414,17 +502,30 @@ class SqliteQueryGenerator(SqlGenerator):
             col = f"cast ({col} as text)"
         return col
 
-    def _gen_sql_update(self, term: SetTerm) -> str:
+    def _gen_sql_update(self, term: SetTerm) -> tuple:
         key = term.parsed[0].select_term.bare_term
         if not self.data or self.data.get(key) is None:
             raise ParseError(f'Target key of update: {key} not found in payload')
         new = json.dumps(self.data)
-        return f"set data = json_patch(data, '{new}')"
+        return "set data = json_patch(data, ?)", (new,)
 
 
 class PostgresQueryGenerator(SqlGenerator):
 
     json_array_sql = 'jsonb_build_array'
+    integer_cast_ops = frozenset(['gt', 'gte', 'lt', 'lte'])
+    array_selection_sql = _minify("""
+            case when data#>'{{{target}}}'{indexer}{idx} is not null then
+                data#>'{{{target}}}'{indexer}{idx}
+            else null end
+            """)
+    array_sub_selection_sql = _minify("""
+            case
+                when data#>'{{{target}}}' is not null
+                and jsonb_typeof(data#>'{{{target}}}') = 'array'
+            then {data_selection_expr}
+            else null end
+            """)
     db_init_sql = [
         """
         create or replace function filter_array_elements(data jsonb, keys text[])
@@ -470,19 +571,22 @@ class PostgresQueryGenerator(SqlGenerator):
     ]
 
     def _maybe_apply_function(self, term: SelectTerm, selection: str) -> str:
-        if not term.func:
+        func = term.func
+        if not func:
             return selection
-        elif term.func == 'count':
+        elif func == 'count':
             if term.original in ['*', '1']:
                 selection = '1'
         else:
-            if term.func in ['avg', 'sum', 'min', 'max']:
+            if func in ['avg', 'sum', 'min', 'max']:
                 selection = f"({selection})::int"
-            if term.func.endswith('_ts'):
-                term.func = term.func.replace('_ts', '')
-        return f"{term.func}({selection})"
+            if func.endswith('_ts'):
+                func = func.replace('_ts', '')
+        return f"{func}({selection})"
 
-    def _gen_select_target(self, term_attr: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _gen_select_target(term_attr: str) -> str:
         return term_attr.replace('.', ',') if '.' in term_attr else term_attr
 
     def _gen_sql_key_selection(self, term: SelectTerm, parsed: Key) -> str:
@@ -494,11 +598,11 @@ class PostgresQueryGenerator(SqlGenerator):
     def _gen_sql_array_selection(self, term: SelectTerm, parsed: ArraySpecific) -> str:
         target = self._gen_select_target(term.bare_term)
         indexer = "->" if not term.func else "->>"
-        selection = f"""
-            case when data#>'{{{target}}}'{indexer}{parsed.idx} is not null then
-                data#>'{{{target}}}'{indexer}{parsed.idx}
-            else null end
-            """
+        selection = self.array_selection_sql.format(
+            target=target,
+            indexer=indexer,
+            idx=parsed.idx,
+        )
         return self._maybe_apply_function(term, selection)
 
     def _gen_sql_array_sub_selection(
@@ -514,22 +618,16 @@ class PostgresQueryGenerator(SqlGenerator):
         target = self._gen_select_target(term.bare_term)
         sub_selections = ','.join(parsed.sub_selections)
         data_selection_expr = f"filter_array_elements(data#>'{{{target}}}','{{{sub_selections}}}')"
-        if (
-            isinstance(parsed, ArraySpecificSingle)
-            or isinstance(parsed, ArraySpecificMultiple)
-        ):
+        if isinstance(parsed, _ARRAY_SPECIFIC_SUB):
             data_selection_expr = f'{data_selection_expr}->{parsed.idx}'
-        selection = f"""
-            case
-                when data#>'{{{target}}}' is not null
-                and jsonb_typeof(data#>'{{{target}}}') = 'array'
-            then {data_selection_expr}
-            else null end
-            """
+        selection = self.array_sub_selection_sql.format(
+            target=target,
+            data_selection_expr=data_selection_expr,
+        )
         return self._maybe_apply_function(term, selection)
 
     def _gen_sql_col(self, term: Union[SelectTerm, WhereTerm, OrderTerm]) -> str:
-        if isinstance(term, WhereTerm) or isinstance(term, OrderTerm):
+        if isinstance(term, _ELEMENT_TERMS):
             select_term = term.parsed[0].select_term
         elif isinstance(term, SelectTerm):
             select_term = term
@@ -557,23 +655,22 @@ class PostgresQueryGenerator(SqlGenerator):
             target = select_term.parsed[0].element
             col = f"data{final_select_op}'{{{target}}}'"
         if isinstance(term, WhereTerm):
-            try:
-                integer_ops = ['gt', 'gte', 'lt', 'lte']
-                int(term.parsed[0].val)
-                if (
-                    term.parsed[0].op in integer_ops
-                    and str(float(term.parsed[0].val)) != str(term.parsed[0].val)
-                ):
-                    col = f'({col})::int'
-                elif str(float(term.parsed[0].val)) == str(term.parsed[0].val):
-                    col = f'({col})::real'
-            except ValueError:
-                pass
+            val = term.parsed[0].val
+            if isinstance(val, float):
+                col = f'({col})::real'
+            elif term.parsed[0].op in self.integer_cast_ops and _is_int_literal(val):
+                col = f'({col})::int'
         return col
 
-    def _gen_sql_update(self, term: SetTerm) -> str:
+    def _escape_sql(self, sql: str) -> str:
+        # psycopg2 interpolates query parameters with %
+        return sql.replace('%', '%%')
+
+    def _gen_sql_update(self, term: SetTerm) -> tuple:
         target = term.parsed[0].select_term.bare_term
-        if self.data.get(target) is None:
+        val = self.data.get(target) if self.data else None
+        if val is None:
             raise ParseError(f'Target key of update: {target} not found in payload')
-        val = json.dumps(self.data[target])
-        return f" set data = jsonb_set(data, '{{{target}}}', '{val}')"
+        val = json.dumps(val)
+        target = self._escape_sql(target)
+        return f"set data = jsonb_set(data, '{{{target}}}', %s)", (val,)
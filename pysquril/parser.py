@@ -3,6 +3,7 @@
 
 import json
 import re
+import sys
 
 from abc import ABC, abstractmethod
 from typing import Optional, Union, Callable
@@ -133,7 +134,7 @@ class WhereElement(object):
         self.groups_start, self.groups_end = self.categorise_groups(groups)
         self.combinator = combinator
         self.select_term = SelectTerm(term)
-        self.op = op
+        self.op = sys.intern(op) # used for operator lookups
         self.val = val
 
     def categorise_groups(self, groups: list) -> tuple:
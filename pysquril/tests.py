@@ -17,7 +17,7 @@ from termcolor import colored
 
 from pysquril.backends import SqliteBackend, PostgresBackend, sqlite_session, postgres_session
 from pysquril.exc import ParseError
-from pysquril.generator import SqliteQueryGenerator, PostgresQueryGenerator
+from pysquril.generator import SqlGenerator, SqliteQueryGenerator, PostgresQueryGenerator
 from pysquril.test_data import dataset
 
 def sqlite_init(
@@ -91,7 +91,7 @@ class TestBackends(object):
             if verbose:
                 print(colored(q.update_query, 'cyan'))
             with session_func(engine) as session:
-                session.execute(q.update_query)
+                session.execute(q.update_query, q.update_params)
             with session_func(engine) as session:
                 session.execute(f'select * from {table}')
                 resp = session.fetchall()
@@ -204,6 +204,9 @@ class TestBackends(object):
         assert out == [[5, 1]]
         out = run_select_query('select=count(1),avg(x),min(y),sum(x),max_ts(timestamp)')
         assert out == [[5, 526.2500000000000000, 1, 2105, '2020-10-14T20:20:34.388511']]
+        # repeated queries use cached SQL, and must give the same result
+        out = run_select_query('select=count(1),avg(x),min(y),sum(x),max_ts(timestamp)')
+        assert out == [[5, 526.2500000000000000, 1, 2105, '2020-10-14T20:20:34.388511']]
         # nested selections
         out = run_select_query('select=count(a.k1.r2),count(x),count(*)')
         assert out == [[2, 4, 5]]
@@ -345,6 +348,11 @@ class TestBackends(object):
         assert len(out) == 1
         assert out[0][0] == 0
         assert out[0][1] == 1
+        # data is passed as a query parameter, so quotes are fine
+        # and like wildcards in the where clause are left intact
+        out = run_update_query('set=d&where=d=like.*g3', data={'d': "it's"})
+        out = run_select_query('select=z&where=d=like.it*')
+        assert out == [[0]]
 
         # DELETE
         if verbose:
@@ -396,6 +404,14 @@ class TestBackends(object):
             print("$ createdb -O pysquril_user pysquril_db")
             raise
 
+def test_generator_requires_json_array_sql() -> None:
+    with pytest.raises(TypeError):
+        class IncompleteQueryGenerator(SqlGenerator):
+            pass
+    for uri_query in ['', 'select=a', 'where=a=eq.1']:
+        with pytest.raises(TypeError):
+            SqlGenerator('t', uri_query)
+
 class TestSqlBackend(unittest.TestCase):
     __test__ = False
     